@@ -2,11 +2,13 @@
 """
 Quick script to create admin user via environment variables
 Run this in Railway console with: python create_admin.py
+
+With --if-no-staff, nothing is created if any staff user exists already. This is
+how the container entrypoint (init-admin) calls it on every start.
 """
 
 import os
 import sys
-import django
 
 # Setup Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'production_settings')
@@ -15,10 +17,13 @@ os.environ.setdefault('DATA_DIR', '/data')
 # Add src to path
 sys.path.insert(0, '/pretix/src')
 
+import django
+
 # Initialize Django
 django.setup()
 
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 
 # Get environment variables or use defaults
 email = os.environ.get('ADMIN_EMAIL', 'admin@example.com')
@@ -26,15 +31,21 @@ password = os.environ.get('ADMIN_PASSWORD', 'admin123')
 
 User = get_user_model()
 
-# Check if user already exists (by email)
-if User.objects.filter(email=email).exists():
-    print(f"User with email '{email}' already exists")
-else:
-    # Create superuser using pretix's custom user manager
-    # pretix uses email as the username
-    user = User.objects.create_superuser(
-        email=email,
-        password=password
-    )
+if '--if-no-staff' in sys.argv[1:] and User.objects.filter(is_staff=True).exists():
+    print("Superuser already exists")
+    sys.exit(0)
+
+# Look up or create the superuser in one step. pretix uses the email address as the username, and
+# get_or_create() also copes with the user being created concurrently from another console session.
+user, created = User.objects.get_or_create(
+    **{User.USERNAME_FIELD: email},
+    defaults={
+        'is_staff': True,
+        'password': make_password(password),
+    }
+)
+if created:
     print(f"Created superuser: {email}")
     print(f"Password: {password}")
+else:
+    print(f"User with email '{email}' already exists")
@@ -45,6 +45,7 @@ if [ "$1" = "webworker" ]; then
         --workers $NUM_WORKERS \
         --max-requests 1200 \
         --max-requests-jitter 50 \
+        --preload \
         --log-level=info \
         --bind=unix:/tmp/pretix.sock
 fi
@@ -7,31 +7,6 @@ cd /pretix/src
 export DJANGO_SETTINGS_MODULE=production_settings
 export DATA_DIR=/data
 
-# Check if superuser already exists (check for staff users)
-python3 manage.py shell -c "from django.contrib.auth import get_user_model; User = get_user_model(); exit(0) if User.objects.filter(is_staff=True).exists() else exit(1)"
-
-if [ $? -eq 1 ]; then
-    echo "Creating superuser..."
-
-    # Check if ADMIN_PASSWORD is set, otherwise use environment variables or defaults
-    ADMIN_EMAIL=${ADMIN_EMAIL:-admin@example.com}
-    ADMIN_PASSWORD=${ADMIN_PASSWORD:-admin123}
-
-    # Try using create_admin.py script if it exists, otherwise fall back to Django shell
-    if [ -f "/pretix/src/create_admin.py" ]; then
-        python3 /pretix/src/create_admin.py
-    else
-        # Fallback: Use Django shell to create user (pretix uses email, not username)
-        python3 manage.py shell -c "
-from django.contrib.auth import get_user_model
-User = get_user_model()
-if not User.objects.filter(email='$ADMIN_EMAIL').exists():
-    user = User.objects.create_superuser('$ADMIN_EMAIL', '$ADMIN_PASSWORD')
-    print('Created superuser: $ADMIN_EMAIL')
-else:
-    print('User already exists')
-"
-    fi
-else
-    echo "Superuser already exists"
-fi
+# create_admin.py checks for an existing staff user itself, so Django is only started once.
+# It reads ADMIN_EMAIL and ADMIN_PASSWORD from the environment.
+python3 /pretix/src/create_admin.py --if-no-staff
@@ -1,59 +1,94 @@
 import os
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 from pretix.settings import *
 
+# Connection URLs injected by Railway, read once and reused below
+DATABASE_URL = os.environ.get('DATABASE_URL')
+REDIS_URL = os.environ.get('REDIS_URL')
+
 # Parse DATABASE_URL from Railway environment variable
-if 'DATABASE_URL' in os.environ:
-    db_url = urlparse(os.environ['DATABASE_URL'])
+if DATABASE_URL:
+    db_url = urlparse(DATABASE_URL)
 
     # Override database settings from DATABASE_URL
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.postgresql',
-            'NAME': db_url.path[1:],  # Remove leading slash
-            'USER': db_url.username,
-            'PASSWORD': db_url.password,
+            'NAME': unquote(db_url.path.lstrip('/')),
+            # urlparse() leaves credentials percent-encoded
+            'USER': unquote(db_url.username or ''),
+            'PASSWORD': unquote(db_url.password or ''),
             'HOST': db_url.hostname,
             'PORT': db_url.port or 5432,
-            'CONN_MAX_AGE': 120,
+            # Keep connections open across requests; the health check on reuse replaces the reconnect we'd
+            # otherwise pay for every two minutes per worker.
+            'CONN_MAX_AGE': 600,
             'CONN_HEALTH_CHECKS': True,
+            # Required when connecting through pgbouncer in transaction pooling mode
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_DISABLE_SERVER_SIDE_CURSORS', '') == 'true',
+            'OPTIONS': {
+                # TCP keepalives detect connections silently dropped by Railway's network while idle in the pool
+                'keepalives': 1,
+                'keepalives_idle': 30,
+                'keepalives_interval': 10,
+                'keepalives_count': 3,
+                'application_name': 'pretix',
+            },
         }
     }
 
 LOGGING['handlers']['mail_admins']['include_html'] = True
-STORAGES["staticfiles"]["BACKEND"] = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+STORAGES["staticfiles"]["BACKEND"] = 'pretix.helpers.staticfiles.CachedManifestStaticFilesStorage'
 
 # Parse REDIS_URL from Railway environment variable for Celery
-if 'REDIS_URL' in os.environ:
-    redis_url = urlparse(os.environ['REDIS_URL'])
+if REDIS_URL:
+    redis_url = urlparse(REDIS_URL)
 
     # Configure Celery to use Railway Redis
-    CELERY_BROKER_URL = os.environ['REDIS_URL']
-    CELERY_RESULT_BACKEND = os.environ['REDIS_URL']
+    CELERY_BROKER_URL = REDIS_URL
+    CELERY_RESULT_BACKEND = REDIS_URL
+    # Don't let one worker reserve a batch of tasks while it is stuck waiting on a slow payment provider API
+    CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+    # Shared client options for all Redis cache aliases: a bounded pool of keep-alive connections, so that
+    # get_many/set_many batches are sent over an already established socket, and short socket timeouts so a
+    # slow Redis doesn't pin web workers. Values are zlib-compressed to keep larger session blobs small on the
+    # wire. We stay with the default pickle serializer as pretix caches arbitrary Python objects.
+    REDIS_CACHE_OPTIONS = {
+        "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        "CONNECTION_POOL_KWARGS": {
+            "max_connections": 100,
+            "socket_keepalive": True,
+            # Connection-level option, redis-py ignores it on the client once a connection pool is passed
+            "health_check_interval": 30,
+        },
+        "SOCKET_CONNECT_TIMEOUT": 2,
+        "SOCKET_TIMEOUT": 2,
+        "COMPRESSOR": "django_redis.compressors.zlib.ZlibCompressor",
+    }
+    DJANGO_REDIS_CONNECTION_FACTORY = "django_redis.pool.ConnectionFactory"
 
     # Configure Redis cache
+    # The two caching aliases get their own logical Redis databases, separate from the one used by Celery, so
+    # that key scans, flushes and evictions of one alias never have to touch the keys of the others. Sessions
+    # stay in the database named in REDIS_URL, where they have always been, so that a deploy doesn't log
+    # everyone out.
     CACHES = {
         'default': {
             "BACKEND": "django_redis.cache.RedisCache",
-            "LOCATION": os.environ['REDIS_URL'],
-            "OPTIONS": {
-                "CLIENT_CLASS": "django_redis.client.DefaultClient",
-            }
+            "LOCATION": redis_url._replace(path='/1').geturl(),
+            "OPTIONS": REDIS_CACHE_OPTIONS,
         },
         'redis': {
             "BACKEND": "django_redis.cache.RedisCache",
-            "LOCATION": os.environ['REDIS_URL'],
-            "OPTIONS": {
-                "CLIENT_CLASS": "django_redis.client.DefaultClient",
-            }
+            "LOCATION": redis_url._replace(path='/2').geturl(),
+            "OPTIONS": REDIS_CACHE_OPTIONS,
         },
         'redis_sessions': {
             "BACKEND": "django_redis.cache.RedisCache",
-            "LOCATION": os.environ['REDIS_URL'],
+            "LOCATION": REDIS_URL,
             "TIMEOUT": 3600 * 24 * 30,
-            "OPTIONS": {
-                "CLIENT_CLASS": "django_redis.client.DefaultClient",
-            }
+            "OPTIONS": REDIS_CACHE_OPTIONS,
         }
     }
     SESSION_ENGINE = "django.contrib.sessions.backends.cache"
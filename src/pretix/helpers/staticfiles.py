@@ -0,0 +1,49 @@
+#
+# This file is part of pretix (Community Edition).
+#
+# Copyright (C) 2014-2020  Raphael Michel and contributors
+# Copyright (C) 2020-today pretix GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+#
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class CachedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Django already reads ``staticfiles.json`` only once per process, but every ``{% static %}`` call still runs the
+    full name cleaning, manifest lookup and URL quoting/unquoting round trip. Since the manifest does not change
+    while a process is running, we memoize the resulting URL per name.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._url_cache = {}
+        # ManifestFilesMixin reads staticfiles.json right here, so the manifest is loaded once per storage instance
+        super().__init__(*args, **kwargs)
+
+    def url(self, name, force=False):
+        if force or settings.DEBUG:
+            return super().url(name, force)
+        try:
+            return self._url_cache[name]
+        except KeyError:
+            url = self._url_cache[name] = super().url(name)
+            return url
+
+    def save_manifest(self):
+        super().save_manifest()
+        self._url_cache.clear()
@@ -38,4 +38,6 @@ class PluginConfig(AppConfig):
         picture = 'pretixplugins/poli/poli_logo.png'
 
     def ready(self):
-        from . import signals  # noqa
+        # Import the provider class at startup as well, so that with gunicorn's --preload the first checkout
+        # handled by each worker doesn't pay for importing it.
+        from . import payment, signals  # noqa
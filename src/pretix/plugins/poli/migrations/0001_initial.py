@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-15 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('pretixbase', '0296_invoice_invoice_from_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PoliPendingReminder',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('due_at', models.DateTimeField(db_index=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.order')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-15 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poli', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='polipendingreminder',
+            name='suppress_placed_email',
+            field=models.BooleanField(default=False),
+        ),
+    ]
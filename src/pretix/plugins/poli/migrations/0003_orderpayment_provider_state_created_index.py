@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    The reconciliation job looks up pending POLi payments by provider, state and
+    creation date. The index lives on the core OrderPayment table but is only
+    needed by this plugin, so it is created with raw SQL here instead of a
+    pretixbase migration that would collide with upstream migration numbering.
+    """
+
+    dependencies = [
+        ('poli', '0002_polipendingreminder_suppress_placed_email'),
+        ('pretixbase', '0296_invoice_invoice_from_state'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX poli_orderpayment_provider_state_created_idx '
+            'ON pretixbase_orderpayment (provider, state, created)',
+            'DROP INDEX poli_orderpayment_provider_state_created_idx',
+        ),
+    ]
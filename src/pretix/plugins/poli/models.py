@@ -0,0 +1,33 @@
+#
+# This file is part of pretix.
+#
+# Copyright (C) 2025 pretix GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from django.db import models
+
+
+class PoliPendingReminder(models.Model):
+    """
+    A reminder email that is sent for an order placed with POLi once ``due_at`` has passed, unless the order has
+    been paid by then.
+    """
+    id = models.BigAutoField(primary_key=True)
+    order = models.ForeignKey('pretixbase.Order', on_delete=models.CASCADE, related_name='+')
+    due_at = models.DateTimeField(db_index=True)
+    # Set while the 'order placed' email sent right after checkout is still to be held back
+    suppress_placed_email = models.BooleanField(default=False)
@@ -18,10 +18,14 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 
+import base64
 import json
 import logging
-from collections import OrderedDict
+import random
+import socket
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from functools import cached_property, lru_cache, partial
 
 import requests
 from django import forms
@@ -29,6 +33,14 @@ from django.core.exceptions import ValidationError
 from django.http import HttpRequest
 from django.template.loader import get_template
 from django.utils.translation import gettext_lazy as _
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+from urllib3.connection import HTTPConnection
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from pretix.base.forms import SecretKeySettingsField
 from pretix.base.models import Event, OrderPayment
@@ -38,7 +50,92 @@ from pretix.multidomain.urlreverse import build_absolute_uri
 
 logger = logging.getLogger('pretix.plugins.poli')
 
-SUPPORTED_CURRENCIES = ['NZD', 'AUD']
+SUPPORTED_CURRENCIES = frozenset(('NZD', 'AUD'))
+
+# Non-sensitive transaction details that are kept when payment information is shredded
+_SHRED_KEEP_KEYS = (
+    'TransactionRefNo',
+    'TransactionID',
+    'TransactionStatusCode',
+    'TransactionStatus',
+    'PaymentAmount',
+    'CurrencyCode',
+    'EstablishedDateTime',
+    'EndDateTime',
+)
+
+
+class PoliTemporaryError(Exception):
+    """
+    Raised by :py:meth:`Poli.get_transaction_status` if POLi could not be reached or answered with a server error,
+    i.e. if asking again later might succeed.
+    """
+    pass
+
+
+class _JitteredRetry(Retry):
+    """
+    Exponential backoff with up to 50 % random jitter on top, capped at 30 seconds, so that many workers retrying
+    against a struggling POLi API don't do so in lockstep.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return min(backoff * (1 + random.uniform(0, 0.5)), 30)
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTP adapter enabling TCP keepalive on pooled connections, so that connections silently dropped while idle in
+    the pool are detected instead of making the next request hang until the read timeout.
+    """
+    socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, 'TCP_KEEPIDLE'):  # not available on all platforms
+        socket_options += [
+            (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3),
+        ]
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault('socket_options', self.socket_options)
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _json_dumps(obj):
+    """
+    Serialize ``obj`` to a JSON string, using ``orjson`` if it is available.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def _json_body(obj):
+    """
+    Serialize ``obj`` to UTF-8 encoded JSON, ready to be sent as a request body.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _json_loads(value):
+    """
+    Parse a JSON string, using ``orjson`` if it is available. ``orjson.JSONDecodeError`` is a subclass of
+    ``json.JSONDecodeError``, so callers only need to handle the latter.
+    """
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+
+@lru_cache(maxsize=None)
+def _tpl(name):
+    """
+    Return the compiled template ``name``, resolving it through the template loaders only on first use.
+    """
+    return get_template(name)
 
 
 class Poli(BasePaymentProvider):
@@ -51,73 +148,130 @@ class Poli(BasePaymentProvider):
 
     identifier = 'poli'
     verbose_name = _('POLi')
-    payment_form_fields = OrderedDict([])
+    payment_form_fields = {}
+
+    # Payment states in which a failed or timed out transaction needs no further action
+    _failed_states = frozenset((OrderPayment.PAYMENT_STATE_FAILED, OrderPayment.PAYMENT_STATE_CANCELED))
+
+    # Methods handling each POLi transaction status, see process_transaction_result()
+    _status_handlers = {
+        'Completed': '_handle_completed',
+        'Failed': '_handle_failed',
+        'Timeout': '_handle_failed',
+        'ReceiptNotReceived': '_handle_receipt_not_received',
+    }
+
+    # Shared by all provider instances in this process, so that repeated calls to the POLi API can reuse pooled
+    # keep-alive connections instead of paying for a new TCP and TLS handshake every time.
+    _session = None
 
     def __init__(self, event: Event):
         super().__init__(event)
         self.settings = SettingsSandbox('payment', 'poli', event)
 
+    @classmethod
+    def _get_session(cls):
+        """
+        Return the shared POLi API session, creating it on first use. This keeps the connection pool out of
+        worker processes that never talk to POLi, and out of the gunicorn master when workers are preloaded.
+
+        Connection errors, timeouts and rate limiting or gateway errors are retried with backoff, honoring
+        ``Retry-After``. Apart from connection errors, where the request never reached POLi, this only applies to
+        idempotent requests (GetTransaction). Initiate is a POST and replaying it would start a second transaction.
+        """
+        if cls._session is None:
+            session = requests.Session()
+            session.mount('https://', _KeepAliveAdapter(
+                pool_connections=10,
+                pool_maxsize=20,
+                max_retries=_JitteredRetry(
+                    total=3,
+                    backoff_factor=1.0,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                ),
+            ))
+            cls._session = session
+        return cls._session
+
+    @cached_property
+    def _endpoint(self):
+        return self.settings.get('endpoint', 'production')
+
+    @cached_property
+    def _auth_header(self):
+        """
+        The value of the ``Authorization`` header for the configured POLi credentials.
+        """
+        credentials = f"{self.settings.get('merchant_code')}:{self.settings.get('authentication_code')}".encode()
+        return f'Basic {base64.b64encode(credentials).decode()}'
+
     @property
     def test_mode_message(self):
-        if self.settings.get('endpoint') == 'uat':
+        if self._endpoint == 'uat':
             return _('POLi test mode is enabled. No real money will be transferred.')
         return None
 
-    def get_base_url(self):
+    @cached_property
+    def base_url(self):
         """
-        Get the appropriate POLi API base URL based on the endpoint setting.
+        The appropriate POLi API base URL based on the endpoint setting.
         """
-        endpoint = self.settings.get('endpoint', 'production')
-        if endpoint == 'uat':
+        if self._endpoint == 'uat':
             return 'https://poliapi.uat3.paywithpoli.com'
         else:
             return 'https://poliapi.apac.paywithpoli.com'
 
+    @cached_property
+    def _static_urls(self):
+        """
+        The parts of the Initiate payload that only depend on the event, not on the individual payment. They are
+        kept in the event's cache, which is cleared whenever the event or its domains change.
+        """
+        return self.event.cache.get_or_set('payment_poli_static_urls', lambda: {
+            'MerchantHomepageURL': build_absolute_uri(self.event, 'presale:event.index'),
+            'NotificationURL': build_absolute_uri(self.event, 'plugins:poli:webhook'),
+        }, timeout=3600)
+
     @property
     def settings_form_fields(self):
         """
         Define the settings form fields for configuring POLi in the admin panel.
         """
-        fields = OrderedDict([
-            ('authentication_code',
-             SecretKeySettingsField(
-                  label=_('Authentication Code'),
-                  help_text=_('Your POLi authentication code found in your POLi merchant account settings.'),
-                  required=True,
-             )),
-            ('merchant_code',
-             forms.CharField(
-                 label=_('Merchant Code'),
-                 help_text=_('Your POLi merchant code provided by POLi.'),
-                 required=True,
-                 max_length=50,
-             )),
-            ('endpoint',
-             forms.ChoiceField(
-                 label=_('API Endpoint'),
-                 initial='production',
-                 choices=[
-                     ('production', _('Production (Live)')),
-                     ('uat', _('UAT (Test Environment)')),
-                 ],
-                 help_text=_('Use the UAT environment for testing before going live.'),
-             )),
-            ('timeout',
-             forms.IntegerField(
-                 label=_('Transaction Timeout'),
-                 initial=900,
-                 min_value=60,
-                 max_value=3600,
-                 help_text=_('Time in seconds before the transaction expires. Default is 900 (15 minutes).'),
-                 required=False,
-             )),
-        ])
-
-        d = OrderedDict(
-            list(super().settings_form_fields.items()) + list(fields.items())
-        )
-        d.move_to_end('_enabled', last=False)
-        return d
+        fields = {
+            'authentication_code': SecretKeySettingsField(
+                label=_('Authentication Code'),
+                help_text=_('Your POLi authentication code found in your POLi merchant account settings.'),
+                required=True,
+            ),
+            'merchant_code': forms.CharField(
+                label=_('Merchant Code'),
+                help_text=_('Your POLi merchant code provided by POLi.'),
+                required=True,
+                max_length=50,
+            ),
+            'endpoint': forms.ChoiceField(
+                label=_('API Endpoint'),
+                initial='production',
+                choices=[
+                    ('production', _('Production (Live)')),
+                    ('uat', _('UAT (Test Environment)')),
+                ],
+                help_text=_('Use the UAT environment for testing before going live.'),
+            ),
+            'timeout': forms.IntegerField(
+                label=_('Transaction Timeout'),
+                initial=900,
+                min_value=60,
+                max_value=3600,
+                help_text=_('Time in seconds before the transaction expires. Default is 900 (15 minutes).'),
+                required=False,
+            ),
+        }
+
+        d = {**super().settings_form_fields, **fields}
+        return {'_enabled': d.pop('_enabled'), **d}
 
     def settings_form_clean(self, cleaned_data):
         """
@@ -136,13 +290,17 @@ class Poli(BasePaymentProvider):
                 'payment_poli_merchant_code': _('Merchant code is required.')
             })
 
+        # The credentials are about to change, don't keep sending the old ones
+        self.__dict__.pop('_auth_header', None)
         return cleaned_data
 
     def is_allowed(self, request: HttpRequest, total: Decimal = None) -> bool:
         """
         Check if POLi is allowed for this request/currency.
         """
-        return super().is_allowed(request, total) and self.event.currency in SUPPORTED_CURRENCIES
+        if self.event.currency not in SUPPORTED_CURRENCIES:
+            return False
+        return super().is_allowed(request, total)
 
     @property
     def abort_pending_allowed(self):
@@ -164,7 +322,7 @@ class Poli(BasePaymentProvider):
         """
         Render the payment form shown to users during checkout.
         """
-        template = get_template('pretixplugins/poli/checkout_payment_form.html')
+        template = _tpl('pretixplugins/poli/checkout_payment_form.html')
         ctx = {
             'request': request,
             'event': self.event,
@@ -177,16 +335,15 @@ class Poli(BasePaymentProvider):
         Validate and prepare for POLi payment.
 
         This is called during checkout when user selects POLi as payment method.
-        We don't initiate the transaction yet - that happens in payment_prepare.
+        We don't initiate the transaction yet - that happens in execute_payment.
         """
-        logger.info(f'[POLi DEBUG] checkout_prepare called with total: {total}, currency: {self.event.currency}')
         return True
 
     def checkout_confirm_render(self, request):
         """
         Render the confirmation page before redirecting to POLi.
         """
-        template = get_template('pretixplugins/poli/checkout_payment_confirm.html')
+        template = _tpl('pretixplugins/poli/checkout_payment_confirm.html')
         ctx = {
             'request': request,
             'event': self.event,
@@ -194,40 +351,67 @@ class Poli(BasePaymentProvider):
         }
         return template.render(ctx)
 
-    def get_transaction_status(self, token):
+    def get_transaction_status(self, token, raise_temporary=False):
         """
         Query POLi for the status of a transaction using the GetTransaction API.
 
-        Returns the transaction data if successful, or None if failed.
+        Returns the transaction data if successful, or None if failed. With ``raise_temporary``, failures that might
+        go away by asking again later raise :py:class:`PoliTemporaryError` instead, while a token POLi rejects still
+        returns None.
         """
-        authentication_code = self.settings.get('authentication_code')
-        merchant_code = self.settings.get('merchant_code')
-
-        # Create Basic Auth header
-        auth_string = f"{merchant_code}:{authentication_code}"
-        auth_header = f"Basic {__import__('base64').b64encode(auth_string.encode()).decode()}"
+        return self._get_transaction_status(token, self._auth_header, self.base_url, raise_temporary)
 
+    def _get_transaction_status(self, token, auth_header, base_url, raise_temporary=False):
         headers = {
             'Authorization': auth_header,
         }
 
-        base_url = self.get_base_url()
         api_url = f"{base_url}/api/v2/Transaction/GetTransaction"
 
         try:
-            response = requests.get(
+            response = self._get_session().get(
                 api_url,
                 params={'token': token},
                 headers=headers,
-                timeout=30
+                timeout=(3.05, 10)
             )
-            response.raise_for_status()
-            return response.json()
-
         except requests.RequestException as e:
-            logger.exception(f'POLi GetTransaction failed: {str(e)}')
+            logger.exception('POLi GetTransaction failed: %s', e)
+            if raise_temporary:
+                raise PoliTemporaryError(str(e)) from e
             return None
 
+        if response.status_code >= 400:
+            # Transient errors have already been retried by the session's adapter, other client errors won't go
+            # away by asking again.
+            logger.error('POLi GetTransaction returned HTTP %s', response.status_code)
+            if raise_temporary and (response.status_code >= 500 or response.status_code == 429):
+                raise PoliTemporaryError('HTTP {}'.format(response.status_code))
+            return None
+
+        try:
+            transaction_data = response.json()
+        except ValueError:
+            logger.exception('POLi GetTransaction returned an invalid response')
+            return None
+
+        # Keep the token with the transaction details, so that the status can be looked up again later on
+        transaction_data['token'] = token
+        return transaction_data
+
+    def batch_get_transaction_status(self, tokens):
+        """
+        Query POLi for the status of multiple transactions at once, sharing the pooled API session.
+
+        Returns a dictionary mapping each token to its transaction data, or None if the lookup failed.
+        """
+        # Read everything that depends on the settings here, the worker threads should only do HTTP requests
+        auth_header, base_url = self._auth_header, self.base_url
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            return dict(zip(tokens, executor.map(
+                partial(self._get_transaction_status, auth_header=auth_header, base_url=base_url), tokens
+            )))
+
     def execute_payment(self, request: HttpRequest, payment: OrderPayment):
         """
         Execute the payment by initiating a POLi transaction.
@@ -235,127 +419,99 @@ class Poli(BasePaymentProvider):
         This is called when the user confirms the order. We initiate
         the POLi transaction and return the redirect URL.
         """
-        amount = str(payment.amount)
-        currency_code = self.event.currency
-        merchant_reference = payment.order.code
-        merchant_homepage_url = build_absolute_uri(self.event, 'presale:event.index')
-        success_url = build_absolute_uri(
-            self.event,
-            'plugins:poli:return',
-            kwargs={
-                'order': payment.order.code,
-                'payment': payment.pk,
-                'hash': payment.order.secret
-            }
-        )
-        failure_url = success_url
-        cancellation_url = build_absolute_uri(
-            self.event,
-            'plugins:poli:cancel',
-            kwargs={
-                'order': payment.order.code,
-                'payment': payment.pk,
-                'hash': payment.order.secret
-            }
-        )
-        notification_url = build_absolute_uri(self.event, 'plugins:poli:webhook')
-
-        timeout = self.settings.get('timeout', 900)
+        order = payment.order
+        order_code = order.code
+        url_kwargs = {
+            'order': order_code,
+            'payment': payment.pk,
+            'hash': order.secret
+        }
+        success_url = build_absolute_uri(self.event, 'plugins:poli:return', kwargs=url_kwargs)
 
         payload = {
-            'Amount': amount,
-            'CurrencyCode': currency_code,
-            'MerchantReference': merchant_reference,
-            'MerchantHomepageURL': merchant_homepage_url,
+            **self._static_urls,
+            'Amount': str(payment.amount),
+            'CurrencyCode': self.event.currency,
+            'MerchantReference': order_code,
             'SuccessURL': success_url,
-            'FailureURL': failure_url,
-            'CancellationURL': cancellation_url,
-            'NotificationURL': notification_url,
-            'Timeout': timeout,
-            'MerchantData': json.dumps({
-                'order_code': payment.order.code,
+            'FailureURL': success_url,
+            'CancellationURL': build_absolute_uri(self.event, 'plugins:poli:cancel', kwargs=url_kwargs),
+            'Timeout': self.settings.get('timeout', 900, as_type=int),
+            'MerchantData': _json_dumps({
+                'order_code': order_code,
                 'payment_id': payment.pk,
             }),
         }
 
-        authentication_code = self.settings.get('authentication_code')
-        merchant_code = self.settings.get('merchant_code')
-
-        # Create Basic Auth header
-        auth_string = f"{merchant_code}:{authentication_code}"
-        auth_header = f"Basic {__import__('base64').b64encode(auth_string.encode()).decode()}"
-
         headers = {
             'Content-Type': 'application/json',
-            'Authorization': auth_header,
+            'Authorization': self._auth_header,
         }
 
-        base_url = self.get_base_url()
-        api_url = f"{base_url}/api/v2/Transaction/Initiate"
+        api_url = f"{self.base_url}/api/v2/Transaction/Initiate"
 
         try:
-            response = requests.post(
+            # Serialize the body ourselves instead of using json=, which always goes through the stdlib encoder
+            response = self._get_session().post(
                 api_url,
-                json=payload,
+                data=_json_body(payload),
                 headers=headers,
-                timeout=30
+                timeout=(3.05, 10)
             )
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get('Success'):
-                # Store transaction details for later verification
-                request.session['payment_poli_token'] = data.get('TransactionRefNo')
-                request.session['payment_poli_payment_id'] = payment.pk
-
-                # Store payment info with the transaction reference
-                payment.info = json.dumps({
-                    'transaction_ref_no': data.get('TransactionRefNo'),
-                    'navigate_url': data.get('NavigateURL'),
-                })
-                payment.save(update_fields=['info'])
-
-                logger.info(f'POLi transaction initiated for payment {payment.pk}: {data.get("TransactionRefNo")}')
-
-                return data.get('NavigateURL')
-            else:
-                error_code = data.get('ErrorCode', 'Unknown')
-                error_message = data.get('ErrorMessage', 'Unknown error')
-                logger.error(f'POLi InitiateTransaction failed: {error_code} - {error_message}')
-                payment.order.log_action(
-                    'pretix.event.order.payment.failed',
-                    {
-                        'local_id': payment.local_id,
-                        'provider': self.identifier,
-                        'error': f'{error_code}: {error_message}'
-                    }
-                )
-                raise PaymentException(
-                    _('We were unable to initiate the POLi transaction. Please try again or contact support.')
+            if response.status_code >= 500:
+                # POLi is unavailable right now, the customer can simply try again a bit later
+                logger.error('POLi InitiateTransaction returned HTTP %s', response.status_code)
+                self._initiate_failed(
+                    payment, f'HTTP {response.status_code}',
+                    _('We were unable to reach POLi. Please try again or contact support.')
                 )
-
+            data = response.json()
         except requests.RequestException as e:
-            logger.exception(f'POLi API request failed: {str(e)}')
-            payment.order.log_action(
-                'pretix.event.order.payment.failed',
-                {
-                    'local_id': payment.local_id,
-                    'provider': self.identifier,
-                    'error': str(e)
-                }
-            )
-            raise PaymentException(
+            logger.exception('POLi API request failed: %s', e)
+            self._initiate_failed(
+                payment, str(e),
                 _('We were unable to reach POLi. Please try again or contact support.')
             )
 
-    def payment_prepare(self, request, payment: OrderPayment):
-        """
-        Initiate a POLi payment for an existing order.
+        if response.status_code < 400 and data.get('Success'):
+            # Store transaction details for later verification
+            request.session['payment_poli_token'] = data.get('TransactionRefNo')
+            request.session['payment_poli_payment_id'] = payment.pk
+
+            # Store payment info with the transaction reference
+            payment.info = _json_dumps({
+                'transaction_ref_no': data.get('TransactionRefNo'),
+                'navigate_url': data.get('NavigateURL'),
+            })
+            payment.save(update_fields=['info'])
+
+            logger.info('POLi transaction initiated for payment %s: %s', payment.pk, data.get('TransactionRefNo'))
 
-        This is called when a user retries payment or changes payment method.
-        We initiate the POLi transaction and return the redirect URL.
+            return data.get('NavigateURL')
+
+        # POLi rejected the request (e.g. invalid credentials or data). Retrying will not help, so we fail
+        # immediately with the error POLi reported.
+        error_code = data.get('ErrorCode', 'Unknown')
+        error_message = data.get('ErrorMessage', 'Unknown error')
+        logger.error('POLi InitiateTransaction failed: %s - %s', error_code, error_message)
+        self._initiate_failed(
+            payment, f'{error_code}: {error_message}',
+            _('We were unable to initiate the POLi transaction. Please try again or contact support.')
+        )
+
+    def _initiate_failed(self, payment: OrderPayment, error, message):
         """
-        return self.execute_payment(request, payment)
+        Log a failed transaction initiation on the order and abort the payment with ``message``.
+        """
+        payment.order.log_action(
+            'pretix.event.order.payment.failed',
+            {
+                'local_id': payment.local_id,
+                'provider': self.identifier,
+                'error': error
+            }
+        )
+        raise PaymentException(message)
 
     def process_transaction_result(self, payment: OrderPayment, transaction_data):
         """
@@ -364,62 +520,77 @@ class Poli(BasePaymentProvider):
         Updates the payment status based on the transaction status from POLi.
         """
         transaction_status = transaction_data.get('TransactionStatusCode')
-        transaction_ref_no = transaction_data.get('TransactionRefNo')
 
         if not transaction_status:
-            logger.error(f'POLi transaction missing status: {transaction_data}')
+            logger.error('POLi transaction missing status: %s', transaction_data)
             return False
 
-        # Update payment info with full transaction details
-        payment.info = json.dumps(transaction_data)
-        payment.save(update_fields=['info'])
-
-        if transaction_status == 'Completed':
-            # Transaction successful
-            if payment.state != OrderPayment.PAYMENT_STATE_CONFIRMED:
-                try:
-                    payment.confirm()
-                    logger.info(f'POLi payment confirmed: {payment.pk}, Transaction: {transaction_ref_no}')
-                    return True
-                except Exception as e:
-                    logger.exception(f'Failed to confirm POLi payment: {str(e)}')
-                    return False
-            else:
-                # Already confirmed
-                return True
-
-        elif transaction_status == 'Failed':
-            # Transaction failed
-            if payment.state not in (OrderPayment.PAYMENT_STATE_FAILED, OrderPayment.PAYMENT_STATE_CANCELED):
-                payment.fail(info=transaction_data)
-                logger.warning(f'POLi payment failed: {payment.pk}, Transaction: {transaction_ref_no}')
-            return False
+        # Keep the full transaction details on the payment. They are written to the database together with the
+        # state change below: confirm() and fail() persist ``info`` themselves, so no separate UPDATE is needed.
+        payment.info = _json_dumps(transaction_data)
 
-        elif transaction_status == 'Timeout':
-            # Transaction timed out
-            if payment.state not in (OrderPayment.PAYMENT_STATE_FAILED, OrderPayment.PAYMENT_STATE_CANCELED):
-                payment.fail(info=transaction_data)
-                logger.warning(f'POLi payment timed out: {payment.pk}, Transaction: {transaction_ref_no}')
-            return False
+        handler = self._status_handlers.get(transaction_status, '_handle_unknown')
+        return getattr(self, handler)(payment, transaction_data)
 
-        elif transaction_status == 'ReceiptNotReceived':
-            # POLi couldn't confirm the final status from the bank
-            # Keep as pending and manually reconcile
-            payment.state = OrderPayment.PAYMENT_STATE_PENDING
-            payment.save(update_fields=['state'])
-            logger.warning(f'POLi payment receipt not received: {payment.pk}, Transaction: {transaction_ref_no}')
+    def _handle_completed(self, payment: OrderPayment, transaction_data):
+        # Transaction successful
+        if payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED:
+            # Already confirmed
+            return True
+        try:
+            payment.confirm()
+            logger.info('POLi payment confirmed: %s, Transaction: %s', payment.pk, transaction_data.get('TransactionRefNo'))
+            return True
+        except Exception as e:
+            logger.exception('Failed to confirm POLi payment: %s', e)
             return False
 
+    def _handle_failed(self, payment: OrderPayment, transaction_data):
+        # Transaction failed or timed out
+        if payment.state not in self._failed_states:
+            payment.fail(info=transaction_data)
+            logger.warning('POLi payment not completed (%s): %s, Transaction: %s', transaction_data['TransactionStatusCode'],
+                           payment.pk, transaction_data.get('TransactionRefNo'))
+        return False
+
+    def _handle_receipt_not_received(self, payment: OrderPayment, transaction_data):
+        # POLi couldn't confirm the final status from the bank
+        # Keep as pending and manually reconcile
+        self._update_unfinished(payment, state=OrderPayment.PAYMENT_STATE_PENDING, info=payment.info)
+        logger.warning('POLi payment receipt not received: %s, Transaction: %s', payment.pk,
+                       transaction_data.get('TransactionRefNo'))
+        return False
+
+    def _handle_unknown(self, payment: OrderPayment, transaction_data):
+        # Unknown status, store the details for manual reconciliation
+        self._update_unfinished(payment, info=payment.info)
+        logger.error('POLi unknown transaction status: %s for payment %s', transaction_data['TransactionStatusCode'],
+                     payment.pk)
+        return False
+
+    def _update_unfinished(self, payment: OrderPayment, **fields):
+        """
+        Write ``fields`` to the payment, but only if it is still created or pending in the database.
+
+        confirm() and fail() lock the payment row themselves, this is the equivalent for the remaining status
+        updates: a single conditional UPDATE, so that a result processed concurrently for the same transaction
+        (e.g. return and nudge at the same time) can't turn a confirmed or failed payment back into a pending one.
+        """
+        updated = OrderPayment.objects.filter(
+            pk=payment.pk,
+            state__in=(OrderPayment.PAYMENT_STATE_CREATED, OrderPayment.PAYMENT_STATE_PENDING),
+        ).update(**fields)
+        if updated:
+            for k, v in fields.items():
+                setattr(payment, k, v)
         else:
-            # Unknown status
-            logger.error(f'POLi unknown transaction status: {transaction_status} for payment {payment.pk}')
-            return False
+            payment.refresh_from_db()
 
     def payment_pending_render(self, request, payment):
         """
         Render the pending payment page.
         """
-        template = get_template('pretixplugins/poli/pending.html')
+        template = _tpl('pretixplugins/poli/pending.html')
         ctx = {
             'request': request,
             'event': self.event,
@@ -434,7 +605,7 @@ class Poli(BasePaymentProvider):
         """
         Render the payment info in the admin control panel.
         """
-        template = get_template('pretixplugins/poli/control.html')
+        template = _tpl('pretixplugins/poli/control.html')
         ctx = {
             'request': request,
             'event': self.event,
@@ -449,9 +620,10 @@ class Poli(BasePaymentProvider):
         """
         Render a short representation of the payment for the admin UI.
         """
-        if payment.info_data:
-            ref_no = payment.info_data.get('TransactionRefNo')
-            status = payment.info_data.get('TransactionStatus', 'Unknown')
+        info_data = payment.info_data
+        if info_data:
+            ref_no = info_data.get('TransactionRefNo')
+            status = info_data.get('TransactionStatus', 'Unknown')
             if ref_no:
                 return f'POLi {ref_no} ({status})'
         return f'POLi ({payment.get_state_display()})'
@@ -460,8 +632,9 @@ class Poli(BasePaymentProvider):
         """
         Get a unique identifier for this payment for reconciliation.
         """
-        if payment.info_data:
-            return payment.info_data.get('TransactionRefNo') or payment.info_data.get('TransactionID')
+        info_data = payment.info_data
+        if info_data:
+            return info_data.get('TransactionRefNo') or info_data.get('TransactionID')
         return None
 
     def shred_payment_info(self, obj):
@@ -472,32 +645,27 @@ class Poli(BasePaymentProvider):
             return
 
         try:
-            data = json.loads(obj.info)
+            data = _json_loads(obj.info)
+            if data.get('_shredded'):
+                # Nothing left to remove
+                return
             # Keep non-sensitive fields only
-            shredded_data = {
-                'TransactionRefNo': data.get('TransactionRefNo'),
-                'TransactionID': data.get('TransactionID'),
-                'TransactionStatusCode': data.get('TransactionStatusCode'),
-                'TransactionStatus': data.get('TransactionStatus'),
-                'PaymentAmount': data.get('PaymentAmount'),
-                'CurrencyCode': data.get('CurrencyCode'),
-                'EstablishedDateTime': data.get('EstablishedDateTime'),
-                'EndDateTime': data.get('EndDateTime'),
-                '_shredded': True
-            }
-            obj.info = json.dumps(shredded_data)
+            shredded_data = {k: data.get(k) for k in _SHRED_KEEP_KEYS}
+            shredded_data['_shredded'] = True
+            obj.info = _json_dumps(shredded_data)
             obj.save(update_fields=['info'])
         except (json.JSONDecodeError, TypeError):
-            logger.warning(f'Failed to shred payment info for payment {obj.pk}')
+            logger.warning('Failed to shred payment info for payment %s', obj.pk)
 
     def api_payment_details(self, payment):
         """
         Return payment details for the pretix API.
         """
+        info_data = payment.info_data or {}
         return {
-            'transaction_ref_no': payment.info_data.get('TransactionRefNo') if payment.info_data else None,
-            'transaction_id': payment.info_data.get('TransactionID') if payment.info_data else None,
-            'transaction_status': payment.info_data.get('TransactionStatus') if payment.info_data else None,
-            'bank_receipt': payment.info_data.get('BankReceipt') if payment.info_data else None,
-            'financial_institution': payment.info_data.get('FinancialInstitutionName') if payment.info_data else None,
+            'transaction_ref_no': info_data.get('TransactionRefNo'),
+            'transaction_id': info_data.get('TransactionID'),
+            'transaction_status': info_data.get('TransactionStatus'),
+            'bank_receipt': info_data.get('BankReceipt'),
+            'financial_institution': info_data.get('FinancialInstitutionName'),
         }
@@ -19,14 +19,30 @@
 # <https://www.gnu.org/licenses/>.
 
 import logging
-
+from collections import defaultdict
 from datetime import timedelta
+
+from django.db import connection, transaction
 from django.dispatch import receiver
 from django.utils.timezone import now
-from pretix.base.signals import register_payment_providers, email_filter, order_placed
+from django_scopes import scope, scopes_disabled
+
+from pretix.base.i18n import language
+from pretix.base.models import OrderPayment
+from pretix.base.services.mail import prefix_subject
+from pretix.base.services.placeholders import PlaceholderContext
+from pretix.base.signals import (
+    email_filter, order_placed, periodic_task, register_payment_providers,
+)
+from pretix.helpers import OF_SELF
+from pretix.helpers.periodic import minimum_interval
+from pretix.plugins.poli.models import PoliPendingReminder
 
 logger = logging.getLogger(__name__)
 
+# Number of orders handled by a single reminder task, so that one worker does not stay busy for too long
+REMINDER_BATCH_SIZE = 200
+
 
 @receiver(register_payment_providers, dispatch_uid="payment_poli")
 def register_payment_provider(sender, **kwargs):
@@ -37,6 +53,40 @@ def register_payment_provider(sender, **kwargs):
     return Poli
 
 
+def _poli_enabled(event):
+    """
+    Whether POLi is enabled as a payment method for ``event``. This only reads the event's settings, which are
+    loaded once per event object, so it can be used to skip events without POLi before touching the database.
+    """
+    return event.settings.get('payment_poli__enabled', as_type=bool)
+
+
+def _has_poli(order):
+    """
+    Whether any payment of ``order`` uses POLi.
+    """
+    return order.payments.filter(provider='poli').exists()
+
+
+def _order_placed_subject(order):
+    """
+    The subject of the 'order placed' email for ``order``, as pretix sends it in the order's language, including the
+    event's mail prefix and the test mode marker.
+    """
+    event = order.event
+    with language(order.locale, event.settings.region):
+        if order.require_approval:
+            subject_template = event.settings.mail_subject_order_placed_require_approval
+        else:
+            subject_template = event.settings.mail_subject_order_placed
+        # Placeholders that need the payments are not rendered, such a subject just won't match
+        subject = PlaceholderContext(event=event, order=order, payments=[]).format(str(subject_template))
+    subject = prefix_subject(event, subject.replace('\n', ' ').replace('\r', '')[:900])
+    if order.testmode:
+        subject = "[TESTMODE] " + subject
+    return subject
+
+
 @receiver(email_filter, dispatch_uid="payment_poli_email_filter")
 def filter_order_placed_email(sender, message, order, **kwargs):
     """
@@ -45,21 +95,24 @@ def filter_order_placed_email(sender, message, order, **kwargs):
     The email will be sent later (after 2 hours) if the order remains unpaid.
     If payment is completed within 2 hours, the email is never sent.
     """
-    if not order:
+    if not order or not _poli_enabled(order.event):
         return message
 
-    # Check if this is an order with POLi payment
-    if order.payments.filter(provider='poli').exists():
-        # Check the email subject to determine if this is the 'order placed' email
-        # The 'order paid' email should still go through
-        subject = message.subject.lower() if hasattr(message, 'subject') else ''
+    # Rule out everything that can't be the held back email before rendering the subject: attendee emails, and
+    # orders without a POLi payment or whose 'order placed' email has already been dealt with
+    pending = PoliPendingReminder.objects.filter(order=order, suppress_placed_email=True)
+    if order.email not in (getattr(message, 'to', None) or []) or not pending.exists():
+        return message
 
-        # The 'order placed' email subject is "Your order: {code}"
-        # The 'order paid' email subject is "Payment received for your order: {code}"
-        # We only suppress the 'order placed' email to avoid confusing UX during payment flow
-        if 'your order:' in subject and 'payment received' not in subject:
-            # Suppress the immediate email - it will be sent later if needed
-            return None
+    # Translations of other order emails, e.g. 'order changed' or 'payment failed', may use the very same subject,
+    # so the subject alone doesn't tell us this is the 'order placed' email. It is however the first email with this
+    # subject after the order has been placed, which we remember with the order's reminder.
+    if getattr(message, 'subject', None) != _order_placed_subject(order):
+        return message
+
+    if pending.update(suppress_placed_email=False):
+        # Suppress the immediate email to avoid confusing UX during payment flow - it will be sent later if needed
+        return None
 
     return message
 
@@ -69,23 +122,78 @@ def schedule_payment_reminder(sender, order, **kwargs):
     """
     Schedule a reminder email to be sent 2 hours after order placement.
 
-    The task will check if the order is still unpaid and send a reminder
+    The reminder task will check if the order is still unpaid and send a reminder
     if payment has not been completed.
     """
-    # Check if this order uses POLi payment
-    if not order.payments.filter(provider='poli').exists():
+    # Check if this order uses POLi payment, without a query for events that don't offer POLi at all
+    if not _poli_enabled(order.event) or not _has_poli(order):
         return
 
-    # Schedule the reminder task to run in 2 hours
-    from pretix.plugins.poli.tasks import send_pending_payment_reminder
-
+    # Remember the reminder in the database instead of keeping a task with a two-hour ETA in the broker,
+    # send_due_reminders() picks it up once it is due
     try:
-        eta = now() + timedelta(hours=2)
-        send_pending_payment_reminder.apply_async(
-            args=[order.code, order.event.pk],
-            eta=eta,
-        )
-        logger.info(f"Scheduled payment reminder for order {order.code} in 2 hours")
-    except Exception as e:
+        # Within a savepoint, so that a failure doesn't break the transaction the order is placed in
+        with transaction.atomic():
+            PoliPendingReminder.objects.create(
+                order=order, due_at=now() + timedelta(hours=2), suppress_placed_email=True
+            )
+    except Exception:
         # If scheduling fails, log it but don't break the order flow
-        logger.exception(f"Failed to schedule payment reminder for order {order.code}: {e}")
+        logger.exception('Failed to schedule payment reminder for order %s', order.code)
+        return
+    logger.info('Scheduled payment reminder for order %s in 2 hours', order.code)
+
+
+@receiver(periodic_task, dispatch_uid="payment_poli_send_due_reminders")
+@scopes_disabled()
+def send_due_reminders(sender, **kwargs):
+    """
+    Queue the reminder emails that have become due.
+    """
+    from pretix.plugins.poli.tasks import send_pending_payment_reminders
+
+    with transaction.atomic():
+        due = list(PoliPendingReminder.objects.select_for_update(
+            skip_locked=connection.features.has_select_for_update_skip_locked,
+            of=OF_SELF
+        ).filter(due_at__lte=now()).values_list('pk', 'order_id')[:500])
+        order_ids = [order_id for reminder_id, order_id in due]
+        for i in range(0, len(order_ids), REMINDER_BATCH_SIZE):
+            send_pending_payment_reminders.apply_async(args=(order_ids[i:i + REMINDER_BATCH_SIZE],))
+        PoliPendingReminder.objects.filter(pk__in=[reminder_id for reminder_id, order_id in due]).delete()
+
+
+@receiver(periodic_task, dispatch_uid="payment_poli_reconcile")
+@scopes_disabled()
+@minimum_interval(minutes_after_success=15, minutes_after_error=5)
+def reconcile_pending_payments(sender, **kwargs):
+    """
+    Look up POLi payments again that were still pending when we last checked, e.g. because POLi had not yet
+    received the receipt from the customer's bank.
+    """
+    payments = OrderPayment.objects.filter(
+        provider='poli',
+        state=OrderPayment.PAYMENT_STATE_PENDING,
+        created__gte=now() - timedelta(days=2),
+    ).select_related('order', 'order__event', 'order__event__organizer')
+
+    payments_by_event = defaultdict(list)
+    for payment in payments:
+        token = payment.info_data.get('token')
+        if token:
+            payments_by_event[payment.order.event].append((payment, token))
+
+    for event, event_payments in payments_by_event.items():
+        # One event's failure must not keep the payments of all other events from being reconciled
+        try:
+            with scope(organizer=event.organizer):
+                provider = event_payments[0][0].payment_provider
+                if not provider:
+                    # The plugin has been disabled for this event since the payments were made
+                    continue
+                results = provider.batch_get_transaction_status([token for payment, token in event_payments])
+                for payment, token in event_payments:
+                    if results[token]:
+                        provider.process_transaction_result(payment, results[token])
+        except Exception:
+            logger.exception('Could not reconcile pending POLi payments of event %s', event.pk)
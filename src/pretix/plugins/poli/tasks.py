@@ -19,82 +19,236 @@
 # <https://www.gnu.org/licenses/>.
 
 import logging
+import string
+from decimal import Decimal
 
-from django.conf import settings
 from django.utils.timezone import now
 from django_scopes import scope, scopes_disabled
 
 from pretix.base.email import get_email_context
 from pretix.base.i18n import language
-from pretix.base.models import Order, OrderPayment
+from pretix.base.models import Event, Order, OrderPayment
 from pretix.base.services.mail import SendMailException
+from pretix.base.services.placeholders import PlaceholderContext
 from pretix.base.services.tasks import TransactionAwareTask
 from pretix.celery_app import app
+from pretix.plugins.poli.models import PoliPendingReminder
+from pretix.plugins.poli.payment import PoliTemporaryError, _json_loads
 
 logger = logging.getLogger(__name__)
 
+# Delays in seconds between attempts to reach POLi, the last one is repeated if there are more retries
+RETRY_DELAYS = (10, 30, 60, 300, 900)
 
-@app.task(base=TransactionAwareTask, bind=True)
-def send_pending_payment_reminder(self, order_code: str, event_id: int) -> None:
+
+def _retry_countdown(retries: int) -> int:
+    return RETRY_DELAYS[min(retries, len(RETRY_DELAYS) - 1)]
+
+
+def _transaction_matches_payment(payment: OrderPayment, transaction_data: dict) -> bool:
+    """
+    Check that a POLi transaction was initiated for ``payment``, i.e. that it carries the MerchantData we sent for
+    this payment and was made for the payment's amount and currency.
+    """
+    try:
+        merchant_data = _json_loads(transaction_data.get('MerchantData') or '{}')
+        return (
+            str(merchant_data['payment_id']) == str(payment.pk)
+            and merchant_data['order_code'] == payment.order.code
+            and Decimal(str(transaction_data['PaymentAmount'])) == payment.amount
+            and transaction_data['CurrencyCode'] == payment.order.event.currency
+        )
+    except (ValueError, KeyError, TypeError, ArithmeticError):
+        return False
+
+
+@app.task(base=TransactionAwareTask, bind=True, max_retries=5, acks_late=True)
+def verify_payment(self, payment_id: int, token: str) -> None:
+    """
+    Look up the status of a POLi transaction and update the payment accordingly.
+
+    This is queued when the customer returns from POLi, so that the web worker does not have to wait for the
+    POLi API. If POLi can't be reached, we try again with increasing delays.
+    """
+    with scopes_disabled():
+        try:
+            payment = OrderPayment.objects.select_related('order__event__organizer').get(pk=payment_id, provider='poli')
+        except OrderPayment.DoesNotExist:
+            logger.warning('POLi payment %s not found, skipping verification', payment_id)
+            return
+
+    with scope(organizer=payment.order.event.organizer):
+        if payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED:
+            return
+
+        provider = payment.payment_provider
+        try:
+            transaction_data = provider.get_transaction_status(token, raise_temporary=True)
+        except PoliTemporaryError:
+            if self.request.retries >= self.max_retries:
+                logger.error('Giving up verifying POLi payment %s, POLi could not be reached', payment_id)
+                return
+            raise self.retry(countdown=_retry_countdown(self.request.retries))
+
+        if not transaction_data:
+            # POLi rejected the token or sent something we can't use, asking again won't help
+            logger.warning('Could not verify POLi payment %s', payment_id)
+            return
+
+        if not _transaction_matches_payment(payment, transaction_data):
+            # The token comes from the customer's return URL, so it might belong to a different transaction
+            logger.warning('POLi transaction for token %s does not belong to payment %s', token, payment_id)
+            return
+
+        provider.process_transaction_result(payment, transaction_data)
+
+
+@app.task(base=TransactionAwareTask, bind=True, max_retries=5, acks_late=True)
+def process_webhook(self, event_id: int, token: str) -> None:
     """
-    Send order placed reminder email if order is still unpaid after delay.
+    Look up the status of a POLi transaction that POLi notified us about and update the matching payment.
 
-    This task is scheduled 2 hours after an order is created with POLi payment.
-    It checks if the order has been paid, and if not, sends the order placed
-    email as a reminder to complete payment.
+    The payment is identified through the MerchantData we sent to POLi when initiating the transaction.
     """
     with scopes_disabled():
         try:
-            order = Order.objects.get(code=order_code, event_id=event_id)
-        except Order.DoesNotExist:
-            logger.warning(f"Order {order_code} not found, skipping reminder email")
+            event = Event.objects.select_related('organizer').get(pk=event_id)
+        except Event.DoesNotExist:
+            logger.warning('Event %s not found, skipping POLi webhook', event_id)
+            return
+
+    with scope(organizer=event.organizer):
+        provider = event.get_payment_providers().get('poli')
+        if not provider:
+            return
+
+        try:
+            transaction_data = provider.get_transaction_status(token, raise_temporary=True)
+        except PoliTemporaryError:
+            if self.request.retries >= self.max_retries:
+                logger.error('Giving up processing POLi webhook for token %s, POLi could not be reached', token)
+                return
+            raise self.retry(countdown=_retry_countdown(self.request.retries))
+
+        if not transaction_data:
+            # Anyone can call the webhook, so this may well be a made-up token. Don't ask POLi about it again.
+            logger.warning('POLi webhook for token %s was rejected by POLi', token)
             return
 
-    with scope(organizer=order.event.organizer):
-        # Check if order has been paid
-        if order.status == Order.STATUS_PAID:
-            logger.info(f"Order {order_code} already paid, skipping reminder email")
+        try:
+            merchant_data = _json_loads(transaction_data.get('MerchantData') or '{}')
+            payment = OrderPayment.objects.select_related('order__event__organizer').get(
+                pk=merchant_data['payment_id'], provider='poli',
+                order__code=merchant_data['order_code'], order__event=event,
+            )
+        except (ValueError, KeyError, TypeError, OrderPayment.DoesNotExist):
+            logger.warning('POLi webhook for token %s does not match a payment', token)
             return
 
-        # Check if there's a confirmed POLi payment
-        if order.payments.filter(
-            provider='poli',
-            state=OrderPayment.PAYMENT_STATE_CONFIRMED
-        ).exists():
-            logger.info(f"Order {order_code} has confirmed POLi payment, skipping reminder email")
+        if payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED:
             return
 
-        # Check if order is expired or canceled
-        if order.status in (Order.STATUS_EXPIRED, Order.STATUS_CANCELED):
-            logger.info(f"Order {order_code} is {order.status}, skipping reminder email")
+        provider.process_transaction_result(payment, transaction_data)
+
+
+@app.task(base=TransactionAwareTask, bind=True)
+def send_pending_payment_reminder(self, order_code: str, event_id: int) -> None:
+    """
+    Hand a reminder that was queued with a two-hour ETA over to the periodic sweep.
+
+    Reminders used to be scheduled as Celery tasks under this name. This task only exists so that the ones still
+    waiting in the broker when the sweep was introduced are not rejected as unregistered. It can be removed once
+    every worker has been running the new code for more than two hours.
+    """
+    with scopes_disabled():
+        order = Order.objects.filter(code=order_code, event_id=event_id).first()
+        if not order:
+            logger.warning('Order %s not found, skipping reminder email', order_code)
             return
+        PoliPendingReminder.objects.create(order=order, due_at=now())
+
+
+@app.task(base=TransactionAwareTask, bind=True)
+def send_pending_payment_reminders(self, order_ids: list) -> None:
+    """
+    Send the order placed email as a reminder for orders that are still unpaid after a delay.
 
-        # Send the order placed email as a reminder
-        with language(order.locale, order.event.settings.region):
-            # Get the email template and subject
-            if order.require_approval:
-                email_template = order.event.settings.mail_text_order_placed_require_approval
-                subject_template = order.event.settings.mail_subject_order_placed_require_approval
-                log_entry = 'pretix.event.order.email.order_placed_require_approval'
-            else:
-                email_template = order.event.settings.mail_text_order_placed
-                subject_template = order.event.settings.mail_subject_order_placed
-                log_entry = 'pretix.event.order.email.order_placed'
-
-            # Get the payments for this order
-            payments = list(order.payments.all())
-            email_context = get_email_context(event=order.event, order=order, payments=payments)
-
-            try:
-                order.send_mail(
-                    subject_template,
-                    email_template,
-                    email_context,
-                    log_entry,
-                    invoices=[],
-                    attach_tickets=False,  # Don't attach tickets to reminder email
-                    attach_ical=False,
-                )
-                logger.info(f"Sent pending payment reminder email for order {order_code}")
-            except SendMailException:
-                logger.exception(f"Reminder email for order {order_code} could not be sent")
+    This task is queued in batches for the reminders that have become due, 2 hours after an order was created
+    with a POLi payment. Orders that have been paid, have expired or have been canceled in the meantime are
+    skipped, as are orders with a confirmed POLi payment.
+    """
+    # By now, the order's PoliPendingReminder is gone, so filter_order_placed_email() lets the reminder through
+    with scopes_disabled():
+        orders = list(
+            Order.objects.filter(pk__in=order_ids).exclude(
+                status__in=(Order.STATUS_PAID, Order.STATUS_EXPIRED, Order.STATUS_CANCELED)
+            ).select_related('event__organizer').prefetch_related('payments')
+        )
+
+    for order in orders:
+        # The reminders of this batch have already been removed from the database, so one failing order must not
+        # take the others down with it
+        try:
+            with scope(organizer=order.event.organizer):
+                _send_pending_payment_reminder(order)
+        except Exception:
+            logger.exception('Could not send pending payment reminder for order %s', order.code)
+
+
+def _reminder_email_context(order: Order, payments: list, *templates) -> dict:
+    """
+    Build the email context like ``get_email_context``, but only render the placeholders that the given templates
+    actually use, in the currently active language.
+    """
+    try:
+        used = {
+            field_name for template in templates
+            for literal_text, field_name, format_spec, conversion in string.Formatter().parse(str(template))
+            if field_name
+        }
+    except ValueError:
+        # Not a valid format string, let pretix deal with it as usual
+        return get_email_context(event=order.event, order=order, payments=payments)
+
+    context = PlaceholderContext(event=order.event, order=order, payments=payments)
+    return {
+        identifier: context.render_placeholder(placeholder)
+        for identifier, placeholder in context.placeholders.items()
+        if identifier in used
+    }
+
+
+def _send_pending_payment_reminder(order: Order) -> None:
+    # Check if there's a confirmed POLi payment
+    payments = list(order.payments.all())
+    if any(p.provider == 'poli' and p.state == OrderPayment.PAYMENT_STATE_CONFIRMED for p in payments):
+        logger.info("Order %s has confirmed POLi payment, skipping reminder email", order.code)
+        return
+
+    # Send the order placed email as a reminder
+    with language(order.locale, order.event.settings.region):
+        # Get the email template and subject
+        if order.require_approval:
+            email_template = order.event.settings.mail_text_order_placed_require_approval
+            subject_template = order.event.settings.mail_subject_order_placed_require_approval
+            log_entry = 'pretix.event.order.email.order_placed_require_approval'
+        else:
+            email_template = order.event.settings.mail_text_order_placed
+            subject_template = order.event.settings.mail_subject_order_placed
+            log_entry = 'pretix.event.order.email.order_placed'
+
+        email_context = _reminder_email_context(order, payments, subject_template, email_template)
+
+        try:
+            order.send_mail(
+                subject_template,
+                email_template,
+                email_context,
+                log_entry,
+                invoices=[],
+                attach_tickets=False,  # Don't attach tickets to reminder email
+                attach_ical=False,
+            )
+            logger.info("Sent pending payment reminder email for order %s", order.code)
+        except SendMailException:
+            logger.exception("Reminder email for order %s could not be sent", order.code)
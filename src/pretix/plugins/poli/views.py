@@ -18,13 +18,13 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
 # <https://www.gnu.org/licenses/>.
 
+import hmac
 import logging
-from urllib.parse import urlencode
 
 from django.contrib import messages
-from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, HttpResponseBadRequest
-from django.shortcuts import redirect
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseRedirect,
+)
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.clickjacking import xframe_options_exempt
@@ -33,10 +33,46 @@ from django.views.generic import View
 
 from pretix.base.models import Order, OrderPayment
 from pretix.multidomain.urlreverse import eventreverse
+from pretix.plugins.poli.tasks import process_webhook, verify_payment
 
 logger = logging.getLogger('pretix.plugins.poli')
 
 
+def _order_url(order):
+    """
+    Return the URL of the order page the return and cancel views redirect to. Only call this for an order that has
+    been looked up with a valid secret, the URL pattern does not accept arbitrary strings as secret.
+    """
+    return eventreverse(order.event, 'presale:event.order', kwargs={
+        'order': order.code,
+        'secret': order.secret
+    }) + '?opened'
+
+
+def _get_payment(event, order_code, payment_id, secret):
+    """
+    Return the payment with the given ID of the order with the given code and secret, loaded together with its
+    order in a single query.
+
+    Raises ``Order.DoesNotExist`` if there is no such order or the secret does not match, and
+    ``OrderPayment.DoesNotExist`` if the order has no such payment.
+    """
+    try:
+        payment = OrderPayment.objects.select_related('order').get(
+            pk=payment_id, order__code=order_code, order__event=event
+        )
+    except OrderPayment.DoesNotExist:
+        # Only now find out which part was wrong, this raises Order.DoesNotExist for an unknown order or secret
+        event.orders.get_with_secret_check(code=order_code, received_secret=secret, tag=None)
+        raise
+
+    if not hmac.compare_digest(payment.order.secret, secret.lower()):
+        raise Order.DoesNotExist
+    # Use the already loaded event instead of fetching it again
+    payment.order.event = event
+    return payment
+
+
 class PoliReturnView(View):
     """
     Handle the return from POLi after payment attempt.
@@ -54,40 +90,24 @@ class PoliReturnView(View):
         payment_id = kwargs.get('payment')
         hash_value = kwargs.get('hash')
 
-        if not token:
-            messages.error(request, _('No payment token received from POLi.'))
-            return redirect(eventreverse(request.event, 'presale:event.orders', kwargs={
-                'order': order_code
-            }) + '?' + urlencode({'hash': hash_value, 'error': 'poli_no_token'}))
-
         try:
-            order = Order.objects.get(code=order_code, event=request.event)
-            if order.secret != hash_value:
-                raise PermissionDenied()
+            payment = _get_payment(request.event, order_code, payment_id, hash_value)
+            order_url = _order_url(payment.order)
 
-            payment = order.payments.get(pk=payment_id)
+            if not token:
+                messages.error(request, _('No payment token received from POLi.'))
+                return HttpResponseRedirect(order_url)
 
-            # Get transaction status from POLi
-            provider = payment.payment_provider
-            transaction_data = provider.get_transaction_status(token)
-
-            if not transaction_data:
-                messages.error(
-                    request,
-                    _('We were unable to verify your payment with POLi. Please contact support.')
-                )
-                return redirect(eventreverse(request.event, 'presale:event.order', kwargs={
-                    'order': order_code,
-                    'secret': hash_value
-                }) + '?opened')
-
-            # Process the transaction result
-            provider.process_transaction_result(payment, transaction_data)
+            # Look up the transaction status with POLi in the background instead of keeping this worker busy
+            # until the API answers. If Celery runs eagerly, the payment has already been updated afterwards.
+            if payment.state != OrderPayment.PAYMENT_STATE_CONFIRMED:
+                verify_payment.apply_async(args=(payment.pk, token))
+                payment.refresh_from_db()
 
             # Redirect to order confirmation page
             if payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED:
                 messages.success(request, _('Your payment has been completed successfully!'))
-            elif payment.state == OrderPayment.PAYMENT_STATE_PENDING:
+            elif payment.state in (OrderPayment.PAYMENT_STATE_CREATED, OrderPayment.PAYMENT_STATE_PENDING):
                 messages.warning(
                     request,
                     _('Your payment is being processed. We will notify you when it is complete.')
@@ -98,21 +118,18 @@ class PoliReturnView(View):
                     _('Your payment could not be processed. Please try again or choose a different payment method.')
                 )
 
-            return redirect(eventreverse(request.event, 'presale:event.order', kwargs={
-                'order': order_code,
-                'secret': hash_value
-            }) + '?opened')
+            return HttpResponseRedirect(order_url)
 
         except Order.DoesNotExist:
             messages.error(request, _('Order not found.'))
-            return redirect(eventreverse(request.event, 'presale:event.index'))
+            return HttpResponseRedirect(eventreverse(request.event, 'presale:event.index'))
         except OrderPayment.DoesNotExist:
             messages.error(request, _('Payment not found.'))
-            return redirect(eventreverse(request.event, 'presale:event.index'))
+            return HttpResponseRedirect(eventreverse(request.event, 'presale:event.index'))
         except Exception as e:
-            logger.exception(f'Error processing POLi return: {str(e)}')
+            logger.exception('Error processing POLi return: %s', e)
             messages.error(request, _('An error occurred while processing your payment.'))
-            return redirect(eventreverse(request.event, 'presale:event.index'))
+            return HttpResponseRedirect(eventreverse(request.event, 'presale:event.index'))
 
 
 class PoliCancelView(View):
@@ -129,15 +146,15 @@ class PoliCancelView(View):
         hash_value = kwargs.get('hash')
 
         try:
-            order = Order.objects.get(code=order_code, event=request.event)
-            if order.secret != hash_value:
-                raise PermissionDenied()
-
-            payment = order.payments.get(pk=payment_id)
+            payment = _get_payment(request.event, order_code, payment_id, hash_value)
 
             # Mark payment as canceled/failed
             if payment.state == OrderPayment.PAYMENT_STATE_CREATED:
-                payment.cancel()
+                payment.payment_provider.cancel_payment(payment)
+                payment.order.log_action('pretix.event.order.payment.canceled', {
+                    'local_id': payment.local_id,
+                    'provider': payment.provider,
+                })
 
             messages.info(
                 request,
@@ -145,18 +162,18 @@ class PoliCancelView(View):
                     'payment method.')
             )
 
-            return redirect(eventreverse(request.event, 'presale:event.order', kwargs={
-                'order': order_code,
-                'secret': hash_value
-            }) + '?opened')
+            return HttpResponseRedirect(_order_url(payment.order))
 
         except Order.DoesNotExist:
             messages.error(request, _('Order not found.'))
-            return redirect(eventreverse(request.event, 'presale:event.index'))
+            return HttpResponseRedirect(eventreverse(request.event, 'presale:event.index'))
+        except OrderPayment.DoesNotExist:
+            messages.error(request, _('Payment not found.'))
+            return HttpResponseRedirect(eventreverse(request.event, 'presale:event.index'))
         except Exception as e:
-            logger.exception(f'Error processing POLi cancel: {str(e)}')
+            logger.exception('Error processing POLi cancel: %s', e)
             messages.error(request, _('An error occurred.'))
-            return redirect(eventreverse(request.event, 'presale:event.index'))
+            return HttpResponseRedirect(eventreverse(request.event, 'presale:event.index'))
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -178,20 +195,7 @@ class PoliWebhookView(View):
             logger.warning('POLi webhook received without token')
             return HttpResponseBadRequest('Token is required')
 
-        # Get the event from the request - this is a multidomain setup
-        # We need to find the order by querying the transaction data
-        try:
-            # For now, log the webhook and return success
-            # The return view will handle the actual status update
-            logger.info(f'POLi webhook received with token: {token}')
-
-            # For production use, we should:
-            # 1. Query the POLi API to get transaction details
-            # 2. Extract MerchantData which contains order_code and payment_id
-            # 3. Find the corresponding order and payment
-            # 4. Update the payment status
-            return HttpResponse('OK')
-
-        except Exception as e:
-            logger.exception(f'Error processing POLi webhook: {str(e)}')
-            return HttpResponse('OK', status=202)  # Accept but don't process on error
+        # Answer right away and look up the transaction with POLi in the background
+        logger.info('POLi webhook received with token: %s', token)
+        process_webhook.apply_async(args=(request.event.pk, token))
+        return HttpResponse('OK')
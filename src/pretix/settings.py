@@ -747,6 +747,7 @@ CELERY_TASK_ROUTES = ([
     ('pretix.api.webhooks.*', {'queue': 'notifications'}),
     ('pretix.presale.style.*', {'queue': 'background'}),
     ('pretix.plugins.banktransfer.*', {'queue': 'background'}),
+    ('pretix.plugins.poli.tasks.send_pending_payment_reminders', {'queue': 'background'}),
 ],)
 
 BOOTSTRAP3 = {
@@ -0,0 +1,130 @@
+#
+# This file is part of pretix.
+#
+# Copyright (C) 2025 pretix GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core import mail as djmail
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import Event, Order, OrderPayment, Organizer
+from pretix.plugins.poli.models import PoliPendingReminder
+from pretix.plugins.poli.signals import (
+    schedule_payment_reminder, send_due_reminders,
+)
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=o):
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy', currency='NZD',
+            date_from=now(), live=True, plugins='pretix.plugins.poli'
+        )
+        event.settings.set('payment_poli__enabled', True)
+        orders = []
+        for code in ('FOOBAR', 'BARFOO'):
+            order = Order.objects.create(
+                code=code, event=event, email='dummy@dummy.test',
+                status=Order.STATUS_PENDING,
+                datetime=now(), expires=now() + timedelta(days=10),
+                total=Decimal('13.37'),
+                sales_channel=o.sales_channels.get(identifier="web"),
+            )
+            order.payments.create(provider='poli', amount=order.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+            orders.append(order)
+        yield event, orders
+
+
+def _place(event, order):
+    schedule_payment_reminder(event, order=order)
+    order.send_mail(
+        event.settings.mail_subject_order_placed, event.settings.mail_text_order_placed, {'code': order.code},
+        'pretix.event.order.email.order_placed'
+    )
+
+
+def _run_sweep(django_capture_on_commit_callbacks):
+    PoliPendingReminder.objects.update(due_at=now() - timedelta(minutes=1))
+    with django_capture_on_commit_callbacks(execute=True):
+        send_due_reminders(None)
+
+
+@pytest.mark.django_db
+def test_reminder_sent_when_due(env, django_capture_on_commit_callbacks):
+    event, (order, other) = env
+    djmail.outbox = []
+    _place(event, order)
+    # The order placed email is held back
+    assert len(djmail.outbox) == 0
+
+    with django_capture_on_commit_callbacks(execute=True):
+        send_due_reminders(None)
+    assert len(djmail.outbox) == 0
+
+    _run_sweep(django_capture_on_commit_callbacks)
+    assert not PoliPendingReminder.objects.exists()
+    assert len(djmail.outbox) == 1
+    assert djmail.outbox[0].subject == 'Your order: FOOBAR'
+    assert djmail.outbox[0].to == ['dummy@dummy.test']
+
+
+@pytest.mark.django_db
+def test_reminder_sent_if_placed_email_never_went_out(env, django_capture_on_commit_callbacks):
+    event, (order, other) = env
+    schedule_payment_reminder(event, order=order)
+    djmail.outbox = []
+    _run_sweep(django_capture_on_commit_callbacks)
+    assert len(djmail.outbox) == 1
+
+
+@pytest.mark.django_db
+def test_no_reminder_for_paid_order(env, django_capture_on_commit_callbacks):
+    event, (order, other) = env
+    _place(event, order)
+    order.status = Order.STATUS_PAID
+    order.save()
+    djmail.outbox = []
+    _run_sweep(django_capture_on_commit_callbacks)
+    assert len(djmail.outbox) == 0
+
+
+@pytest.mark.django_db
+def test_failing_reminder_does_not_stop_batch(env, django_capture_on_commit_callbacks, monkeypatch):
+    from pretix.plugins.poli import tasks
+
+    event, orders = env
+    for order in orders:
+        _place(event, order)
+    djmail.outbox = []
+
+    send = tasks._send_pending_payment_reminder
+
+    def fail_first(order):
+        if order.code == 'FOOBAR':
+            raise ValueError('broken')
+        send(order)
+
+    monkeypatch.setattr(tasks, '_send_pending_payment_reminder', fail_first)
+    _run_sweep(django_capture_on_commit_callbacks)
+    assert [m.subject for m in djmail.outbox] == ['Your order: BARFOO']
@@ -0,0 +1,174 @@
+#
+# This file is part of pretix.
+#
+# Copyright (C) 2025 pretix GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+import responses
+from django.core import mail as djmail
+from django.core.cache import cache
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import Event, Order, OrderPayment, Organizer
+from pretix.plugins.poli.models import PoliPendingReminder
+from pretix.plugins.poli.signals import (
+    reconcile_pending_payments, schedule_payment_reminder,
+)
+
+GET_TRANSACTION_URL = 'https://poliapi.apac.paywithpoli.com/api/v2/Transaction/GetTransaction'
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=o):
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy', currency='NZD',
+            date_from=now(), live=True, plugins='pretix.plugins.poli'
+        )
+        event.settings.set('payment_poli__enabled', True)
+        o1 = Order.objects.create(
+            code='FOOBAR', event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING,
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=Decimal('13.37'),
+            sales_channel=o.sales_channels.get(identifier="web"),
+        )
+        o1.payments.create(provider='poli', amount=o1.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+        yield event, o1
+
+
+def _send(order, subject_setting, text_setting):
+    settings = order.event.settings
+    order.send_mail(settings.get(subject_setting), settings.get(text_setting), {'code': order.code}, 'test')
+
+
+@pytest.mark.django_db
+def test_placed_email_suppressed_once(env):
+    event, order = env
+    # Some translations, e.g. Norwegian, use the same subject for the 'order placed' and 'order changed' emails
+    event.settings.mail_subject_order_changed = 'Your order: {code}'
+    schedule_payment_reminder(event, order=order)
+    djmail.outbox = []
+
+    _send(order, 'mail_subject_order_placed', 'mail_text_order_placed')
+    assert len(djmail.outbox) == 0
+    assert not PoliPendingReminder.objects.get(order=order).suppress_placed_email
+
+    _send(order, 'mail_subject_order_changed', 'mail_text_order_changed')
+    assert len(djmail.outbox) == 1
+    assert djmail.outbox[0].subject == 'Your order: FOOBAR'
+
+
+@pytest.mark.django_db
+def test_other_emails_not_suppressed(env):
+    event, order = env
+    schedule_payment_reminder(event, order=order)
+    djmail.outbox = []
+
+    _send(order, 'mail_subject_order_changed', 'mail_text_order_changed')
+    assert len(djmail.outbox) == 1
+    assert PoliPendingReminder.objects.get(order=order).suppress_placed_email
+
+
+@pytest.mark.django_db
+def test_placed_email_not_suppressed_without_poli(env):
+    event, order = env
+    event.settings.payment_poli__enabled = False
+    schedule_payment_reminder(event, order=order)
+    djmail.outbox = []
+
+    _send(order, 'mail_subject_order_placed', 'mail_text_order_placed')
+    assert len(djmail.outbox) == 1
+    assert not PoliPendingReminder.objects.exists()
+
+
+@pytest.mark.django_db
+def test_no_subject_rendering_for_orders_without_pending_email(env, monkeypatch):
+    from pretix.plugins.poli import signals
+
+    event, order = env
+    monkeypatch.setattr(signals, '_order_placed_subject', lambda order: pytest.fail('subject rendered'))
+    djmail.outbox = []
+    _send(order, 'mail_subject_order_placed', 'mail_text_order_placed')
+    assert len(djmail.outbox) == 1
+
+
+@pytest.mark.django_db
+def test_schedule_failure_does_not_break_order_placement(env, monkeypatch):
+    event, order = env
+
+    def fail(*args, **kwargs):
+        raise ValueError('broken')
+
+    monkeypatch.setattr(PoliPendingReminder.objects, 'create', fail)
+    schedule_payment_reminder(event, order=order)
+    assert not PoliPendingReminder.objects.exists()
+
+
+@pytest.mark.django_db
+def test_legacy_reminder_task_creates_due_reminder(env):
+    from pretix.plugins.poli.tasks import send_pending_payment_reminder
+
+    event, order = env
+    send_pending_payment_reminder.apply(args=(order.code, event.pk))
+    reminder = PoliPendingReminder.objects.get(order=order)
+    assert reminder.due_at <= now()
+    assert not reminder.suppress_placed_email
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_reconcile_skips_events_without_poli(env):
+    event, order = env
+    with scope(organizer=event.organizer):
+        other_event = Event.objects.create(
+            organizer=event.organizer, name='Other', slug='other', currency='NZD',
+            date_from=now(), live=True, plugins='pretix.plugins.poli'
+        )
+        other_order = Order.objects.create(
+            code='BARFOO', event=other_event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING,
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=Decimal('13.37'),
+            sales_channel=event.organizer.sales_channels.get(identifier="web"),
+        )
+        other_payment = other_order.payments.create(
+            provider='poli', amount=other_order.total, state=OrderPayment.PAYMENT_STATE_PENDING,
+            info='{"token": "other"}'
+        )
+        other_event.plugins = ''
+        other_event.save()
+        payment = order.payments.get()
+        payment.state = OrderPayment.PAYMENT_STATE_PENDING
+        payment.info = '{"token": "token"}'
+        payment.save()
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={'TransactionStatusCode': 'Completed'})
+    cache.clear()
+
+    reconcile_pending_payments(None)
+
+    assert [call.request.params for call in responses.calls] == [{'token': 'token'}]
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+    other_payment.refresh_from_db()
+    assert other_payment.state == OrderPayment.PAYMENT_STATE_PENDING
@@ -0,0 +1,137 @@
+#
+# This file is part of pretix.
+#
+# Copyright (C) 2025 pretix GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+import responses
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import Event, Order, OrderPayment, Organizer
+from pretix.plugins.poli.tasks import verify_payment
+
+GET_TRANSACTION_URL = 'https://poliapi.apac.paywithpoli.com/api/v2/Transaction/GetTransaction'
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=o):
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy', currency='NZD',
+            date_from=now(), live=True, plugins='pretix.plugins.poli'
+        )
+        event.settings.set('payment_poli__enabled', True)
+        o1 = Order.objects.create(
+            code='FOOBAR', event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING,
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=Decimal('13.37'),
+            sales_channel=o.sales_channels.get(identifier="web"),
+        )
+        yield event, o1
+
+
+def _completed_transaction(payment, **kwargs):
+    return {
+        'TransactionStatusCode': 'Completed',
+        'TransactionRefNo': '996117408041',
+        'PaymentAmount': float(payment.amount),
+        'CurrencyCode': 'NZD',
+        'MerchantData': json.dumps({'order_code': payment.order.code, 'payment_id': payment.pk}),
+        **kwargs,
+    }
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_verify_payment_completed(env):
+    event, order = env
+    payment = order.payments.create(provider='poli', amount=order.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+    responses.add(responses.GET, GET_TRANSACTION_URL, json=_completed_transaction(payment))
+    verify_payment.apply(args=(payment.pk, 'token'))
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+    order.refresh_from_db()
+    assert order.status == Order.STATUS_PAID
+
+
+@pytest.mark.django_db
+@responses.activate
+@pytest.mark.parametrize('mismatch', [
+    {'MerchantData': json.dumps({'order_code': 'OTHER', 'payment_id': 0})},
+    {'MerchantData': None},
+    {'PaymentAmount': 1.0},
+    {'CurrencyCode': 'AUD'},
+])
+def test_verify_payment_token_of_other_transaction(env, mismatch):
+    event, order = env
+    payment = order.payments.create(provider='poli', amount=order.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+    responses.add(responses.GET, GET_TRANSACTION_URL, json=_completed_transaction(payment, **mismatch))
+    verify_payment.apply(args=(payment.pk, 'token'))
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CREATED
+    order.refresh_from_db()
+    assert order.status == Order.STATUS_PENDING
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_verify_payment_rejected_token_not_retried(env):
+    event, order = env
+    payment = order.payments.create(provider='poli', amount=order.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={'ErrorCode': 14050}, status=400)
+    result = verify_payment.apply(args=(payment.pk, 'bogus'))
+    assert result.successful()
+    assert len(responses.calls) == 1
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CREATED
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_verify_payment_gives_up_after_retries(env):
+    event, order = env
+    payment = order.payments.create(provider='poli', amount=order.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={}, status=503)
+    result = verify_payment.apply(args=(payment.pk, 'token'))
+    assert result.successful()
+    # 6 task attempts with 4 requests each
+    assert len(responses.calls) == 6 * 4
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CREATED
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_batch_get_transaction_status(env):
+    from pretix.plugins.poli.payment import Poli
+
+    event, order = env
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={'TransactionStatusCode': 'Completed'},
+                  match=[responses.matchers.query_param_matcher({'token': 'good'})])
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={'ErrorCode': 14050}, status=400,
+                  match=[responses.matchers.query_param_matcher({'token': 'bad'})])
+    results = Poli(event).batch_get_transaction_status(['good', 'bad'])
+    assert results == {'good': {'TransactionStatusCode': 'Completed', 'token': 'good'}, 'bad': None}
+    assert all(call.request.headers['Authorization'].startswith('Basic ') for call in responses.calls)
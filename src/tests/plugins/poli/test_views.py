@@ -0,0 +1,125 @@
+#
+# This file is part of pretix.
+#
+# Copyright (C) 2025 pretix GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+import responses
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import Event, Order, OrderPayment, Organizer
+
+GET_TRANSACTION_URL = 'https://poliapi.apac.paywithpoli.com/api/v2/Transaction/GetTransaction'
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=o):
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy', currency='NZD',
+            date_from=now(), live=True, plugins='pretix.plugins.poli'
+        )
+        event.settings.set('payment_poli__enabled', True)
+        o1 = Order.objects.create(
+            code='FOOBAR', event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING,
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=Decimal('13.37'),
+            sales_channel=o.sales_channels.get(identifier="web"),
+        )
+        payment = o1.payments.create(provider='poli', amount=o1.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+        yield event, o1, payment
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_return_confirms_payment(env, client, django_capture_on_commit_callbacks):
+    event, order, payment = env
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={
+        'TransactionStatusCode': 'Completed',
+        'PaymentAmount': 13.37,
+        'CurrencyCode': 'NZD',
+        'MerchantData': json.dumps({'order_code': order.code, 'payment_id': payment.pk}),
+    })
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.get(f'/dummy/dummy/poli/return/FOOBAR/{payment.pk}/{order.secret}/?token=token')
+    assert response.status_code == 302
+    assert response['Location'] == f'/dummy/dummy/order/FOOBAR/{order.secret}/?opened'
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+
+
+@pytest.mark.django_db
+def test_return_without_token(env, client):
+    event, order, payment = env
+    response = client.get(f'/dummy/dummy/poli/return/FOOBAR/{payment.pk}/{order.secret}/')
+    assert response.status_code == 302
+    assert response['Location'] == f'/dummy/dummy/order/FOOBAR/{order.secret}/?opened'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('secret', ['abc-def', 'abcdef'])
+def test_return_bad_hash(env, client, secret):
+    event, order, payment = env
+    response = client.get(f'/dummy/dummy/poli/return/FOOBAR/{payment.pk}/{secret}/?token=token')
+    assert response.status_code == 302
+    assert response['Location'] == '/dummy/dummy/'
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CREATED
+
+
+@pytest.mark.django_db
+def test_return_unknown_payment(env, client):
+    event, order, payment = env
+    response = client.get(f'/dummy/dummy/poli/return/FOOBAR/{payment.pk + 1}/{order.secret}/?token=token')
+    assert response.status_code == 302
+    assert response['Location'] == '/dummy/dummy/'
+
+
+@pytest.mark.django_db
+def test_cancel(env, client):
+    event, order, payment = env
+    response = client.get(f'/dummy/dummy/poli/cancel/FOOBAR/{payment.pk}/{order.secret}/')
+    assert response.status_code == 302
+    assert response['Location'] == f'/dummy/dummy/order/FOOBAR/{order.secret}/?opened'
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CANCELED
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('secret', ['abc-def', 'abcdef'])
+def test_cancel_bad_hash(env, client, secret):
+    event, order, payment = env
+    response = client.get(f'/dummy/dummy/poli/cancel/FOOBAR/{payment.pk}/{secret}/')
+    assert response.status_code == 302
+    assert response['Location'] == '/dummy/dummy/'
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CREATED
+
+
+@pytest.mark.django_db
+def test_cancel_unknown_payment(env, client):
+    event, order, payment = env
+    response = client.get(f'/dummy/dummy/poli/cancel/FOOBAR/{payment.pk + 1}/{order.secret}/')
+    assert response.status_code == 302
+    assert response['Location'] == '/dummy/dummy/'
@@ -0,0 +1,88 @@
+#
+# This file is part of pretix.
+#
+# Copyright (C) 2025 pretix GmbH and contributors
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation in version 3 of the License.
+#
+# ADDITIONAL TERMS APPLY: Pursuant to Section 7 of the GNU Affero General Public License, additional terms are
+# applicable granting you additional permissions and placing additional restrictions on your usage of this software.
+# Please refer to the pretix LICENSE file to obtain the full terms applicable to this work. If you did not receive
+# this file, see <https://pretix.eu/about/en/license>.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+import responses
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import Event, Order, OrderPayment, Organizer
+
+GET_TRANSACTION_URL = 'https://poliapi.apac.paywithpoli.com/api/v2/Transaction/GetTransaction'
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=o):
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy', currency='NZD',
+            date_from=now(), live=True, plugins='pretix.plugins.poli'
+        )
+        event.settings.set('payment_poli__enabled', True)
+        o1 = Order.objects.create(
+            code='FOOBAR', event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING,
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=Decimal('13.37'),
+            sales_channel=o.sales_channels.get(identifier="web"),
+        )
+        payment = o1.payments.create(provider='poli', amount=o1.total, state=OrderPayment.PAYMENT_STATE_CREATED)
+        yield event, o1, payment
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_confirms_payment(env, client, django_capture_on_commit_callbacks):
+    event, order, payment = env
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={
+        'TransactionStatusCode': 'Completed',
+        'TransactionRefNo': '996117408041',
+        'MerchantData': json.dumps({'order_code': order.code, 'payment_id': payment.pk}),
+    })
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post('/dummy/dummy/poli/webhook', {'token': 'token'})
+    assert response.status_code == 200
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_bogus_token(env, client, django_capture_on_commit_callbacks):
+    event, order, payment = env
+    responses.add(responses.GET, GET_TRANSACTION_URL, json={'ErrorCode': 14050}, status=400)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post('/dummy/dummy/poli/webhook', {'token': 'made-up'})
+    assert response.status_code == 200
+    # POLi is asked once and the token is dropped
+    assert len(responses.calls) == 1
+    payment.refresh_from_db()
+    assert payment.state == OrderPayment.PAYMENT_STATE_CREATED
+
+
+@pytest.mark.django_db
+def test_webhook_without_token(env, client):
+    response = client.post('/dummy/dummy/poli/webhook', {})
+    assert response.status_code == 400